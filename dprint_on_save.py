@@ -2,126 +2,922 @@ import sublime
 import sublime_plugin
 import subprocess
 import os
+import json
+import re
+import stat
+import struct
+import sys
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+SETTINGS_FILE = "dprint_on_save.sublime-settings"
+
+# Diagnostic console logging, enabled with "debug": true in SETTINGS_FILE
+_DEBUG = False
+
+
+def _load_settings():
+    global _DEBUG
+    _DEBUG = bool(sublime.load_settings(SETTINGS_FILE).get("debug", False))
+
+
+ANSI_RE = re.compile(rb"\x1B\[[0-?]*[ -/]*[@-~]")
+
+
+def strip_ansi(data):
+    """Remove terminal color codes from raw dprint output bytes."""
+    if b"\x1b" not in data:
+        return data
+    return ANSI_RE.sub(b"", data)
+
+
+_which_cache = {}
+_PATH_CACHE = {"raw": None, "dirs": (), "exts": ("",)}
+
+
+def _search_path():
+    """Return PATH dirs and PATHEXT suffixes, re-split only when they change."""
+    raw = (os.environ.get("PATH", ""), os.environ.get("PATHEXT", ""))
+    if raw != _PATH_CACHE["raw"]:
+        _which_cache.clear()
+        exts = ("",)
+        if os.name == "nt":
+            exts += tuple(raw[1].split(os.pathsep))
+        _PATH_CACHE.update(raw=raw, dirs=tuple(raw[0].split(os.pathsep)), exts=exts)
+    return _PATH_CACHE["dirs"], _PATH_CACHE["exts"]
+
+
+def _find_executable(cmd, dirs, exts):
+    """Walk PATH (and PATHEXT on Windows) looking for an executable."""
+    for directory in dirs:
+        for ext in exts:
+            candidate = os.path.join(directory, cmd + ext)
+            # One stat instead of isfile() + access()
+            try:
+                st = os.stat(candidate)
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode) and st.st_mode & 0o111:
+                return candidate
+    return None
+
+
+def which(cmd):
+    """Locate cmd on PATH, memoized until PATH changes."""
+    dirs, exts = _search_path()
+    if cmd not in _which_cache:
+        _which_cache[cmd] = _find_executable(cmd, dirs, exts)
+    return _which_cache[cmd]
+
+
+CONFIG_NAMES = ("dprint.json", "dprint.jsonc")
+CONFIG_CACHE_TTL = 5.0
+
+_cfg_cache = {}
+# project folder -> config path, pinned until the folders change
+_project_cfg = {}
+# window id -> its folders when the pins were last refreshed
+_window_folders = {}
+_cfg_lock = threading.RLock()
 
 
 def find_dprint_config(start_path):
-    """Find nearest dprint.json or dprint.jsonc up the directory tree."""
+    """Find nearest dprint.json or dprint.jsonc up the directory tree.
+
+    Results are cached for every directory visited during the walk, so
+    saving a sibling file in the same tree is a single dict lookup.
+    """
+    with _cfg_lock:
+        result = _walk_for_config(start_path)
+        if result is not None and not os.path.isfile(result):
+            # The cached config was deleted; forget it and walk again
+            _forget_config(result)
+            result = _walk_for_config(start_path)
+        return result
+
+
+def _forget_config(config_path):
+    for directory, (_, cached) in list(_cfg_cache.items()):
+        if cached == config_path:
+            del _cfg_cache[directory]
+    for folder, cached in list(_project_cfg.items()):
+        if cached == config_path:
+            del _project_cfg[folder]
+
+
+def _walk_for_config(start_path):
+    now = stamp = time.monotonic()
+    visited = []
     current = start_path
     while True:
-        for name in ("dprint.json", "dprint.jsonc"):
-            config_path = os.path.join(current, name)
-            if os.path.exists(config_path):
-                print(f"[dprint] Found config: {config_path}")
-                return config_path
+        cached = _cfg_cache.get(current)
+        if cached is not None and now - cached[0] < CONFIG_CACHE_TTL:
+            stamp, result = cached
+            break
+        visited.append(current)
+        result = None
+        try:
+            with os.scandir(current) as entries:
+                # DirEntry.is_file() uses the cached d_type, so this is
+                # still one readdir and no per-entry stat
+                names = {
+                    entry.name for entry in entries
+                    if entry.name in CONFIG_NAMES and entry.is_file()
+                }
+        except OSError:
+            # Unreadable or vanished directory — keep walking up
+            names = ()
+        for name in CONFIG_NAMES:
+            if name in names:
+                result = os.path.join(current, name)
+                if _DEBUG:
+                    print(f"[dprint] Found config: {result}")
+                break
+        if result:
+            break
+        if current in _project_cfg:
+            # Nothing in the project folder itself; use the config it was
+            # pinned to instead of climbing further
+            result = _project_cfg[current]
+            break
         parent = os.path.dirname(current)
         if parent == current:
-            print("[dprint] No config found.")
-            return None
+            if _DEBUG:
+                print("[dprint] No config found.")
+            break
         current = parent
 
+    for directory in visited:
+        _cfg_cache[directory] = (stamp, result)
+    return result
+
+
+def refresh_project_configs():
+    """Resolve and pin the config for every open project folder.
+
+    A walk that reaches a pinned project folder without finding a config
+    stops there instead of climbing to the filesystem root. The folder is
+    still scanned first, and folders without any config are not pinned,
+    so a config created outside the editor is found once the walk's cache
+    entry expires.
+    """
+    with _cfg_lock:
+        _cfg_cache.clear()
+        _project_cfg.clear()
+        _window_folders.clear()
+        for window in sublime.windows():
+            folders = window.folders()
+            _window_folders[window.id()] = tuple(folders)
+            for folder in folders:
+                config_path = find_dprint_config(folder)
+                if config_path:
+                    _project_cfg[folder] = config_path
+
+
+EDITOR_SCHEMA_VERSION = 5
+
+# Message kinds of the editor-service protocol (schema version 5).
+MSG_SUCCESS_RESPONSE = 0
+MSG_ERROR_RESPONSE = 1
+MSG_SHUTDOWN_PROCESS = 2
+MSG_ACTIVE = 3
+MSG_CAN_FORMAT = 4
+MSG_CAN_FORMAT_RESPONSE = 5
+MSG_FORMAT_FILE = 6
+MSG_FORMAT_FILE_RESPONSE = 7
+
+_SUCCESS_BYTES = b"\xff\xff\xff\xff"
+
+# Buffered binary pipes; a wider kernel pipe lets large documents stream
+# without the writer stalling (pipesize= needs Python 3.10+)
+PIPE_OPTIONS = {"bufsize": 64 * 1024}
+if sys.version_info >= (3, 10):
+    PIPE_OPTIONS["pipesize"] = 1024 * 1024
+
+# Seconds a single dprint request may take before the process is killed,
+# so a hung plugin cannot hold a format worker forever
+REQUEST_TIMEOUT = 10
+
+
+class DprintError(Exception):
+    """dprint ran but reported a formatting error."""
 
-class DprintFormatThread(threading.Thread):
-    def __init__(self, view, file_path, config_path):
-        super().__init__()
-        self.view = view
-        self.file_path = file_path
+
+class EditorServiceError(Exception):
+    """The editor-service process died or sent a malformed message."""
+
+
+class EditorServiceTimeout(EditorServiceError):
+    """The editor-service process did not answer within REQUEST_TIMEOUT."""
+
+
+def _pack_string(data):
+    return struct.pack(">I", len(data)) + data
+
+
+def _reap(proc):
+    """Wait briefly for a shut down process, killing it if it lingers."""
+    try:
+        proc.wait(timeout=1)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+class _DaemonClient:
+    """Long-lived `dprint editor-service` process for one config file.
+
+    Requests are serialized with a lock; a crashed process is respawned
+    once per request before the error is surfaced to the caller. A process
+    that does not answer within REQUEST_TIMEOUT is killed and not retried.
+    """
+
+    def __init__(self, config_path):
         self.config_path = config_path
+        self.proc = None
+        self.next_id = 0
+        self.lock = threading.Lock()
+        self.closed = False
+        # consecutive requests that failed even after a respawn
+        self.failures = 0
+
+    def start(self):
+        """Spawn the process ahead of the first request, if not running."""
+        with self.lock:
+            if self.proc is None or self.proc.poll() is not None:
+                self._spawn()
+
+    def format(self, file_path, code):
+        """Format UTF-8 code, returning bytes or None when unchanged."""
+        return self._request(self._format, file_path, code)
+
+    def can_format(self, file_path):
+        """Ask the service whether the config handles file_path."""
+        return self._request(self._can_format, file_path)
+
+    def _request(self, request, *args):
+        with self.lock:
+            try:
+                return self._timed(request, *args)
+            except EditorServiceTimeout:
+                # A hung request would most likely hang again
+                self._kill()
+                raise
+            except (OSError, EditorServiceError):
+                self._kill()
+                return self._timed(request, *args)
 
-    def run(self):
+    def _timed(self, request, *args):
+        """Run request, killing the process if it does not answer in time."""
+        if self.proc is None or self.proc.poll() is not None:
+            self._spawn()
+        proc = self.proc
+        expired = []
+
+        def expire():
+            expired.append(True)
+            try:
+                proc.kill()
+            except OSError:
+                pass
+
+        timer = threading.Timer(REQUEST_TIMEOUT, expire)
+        timer.daemon = True
+        timer.start()
         try:
-            print(f"[dprint] Formatting started for: {self.file_path}")
-            original_code = self.view.substr(sublime.Region(0, self.view.size()))
-
-            cmd = [
-                "dprint",
-                "fmt",
-                f"--stdin={self.file_path}",
-                "--config",
-                self.config_path,
-            ]
-            print("[dprint] Running:", " ".join(cmd))
-
-            result = subprocess.run(
-                cmd,
-                input=original_code,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-            )
-
-            if result.returncode == 0:
-                formatted = result.stdout
-                if formatted and formatted.strip() != original_code.strip():
-                    sublime.set_timeout(lambda: self._apply_edit(formatted), 0)
-                    print("[dprint] File formatted successfully.")
-                else:
-                    print("[dprint] No formatting changes needed.")
-            else:
-                print("[dprint] Error:")
-                print(result.stderr)
-        except Exception as e:
-            print("[dprint] Exception:", e)
+            return request(*args)
+        except (OSError, EditorServiceError):
+            if expired:
+                raise EditorServiceTimeout(f"no response within {REQUEST_TIMEOUT}s")
+            raise
+        finally:
+            timer.cancel()
 
-    def _apply_edit(self, formatted):
-        """Replace file content and auto-save silently."""
-        self.view.run_command("dprint_replace_content", {"text": formatted})
+    def _can_format(self, file_path):
+        request_id = self._send(MSG_CAN_FORMAT, _pack_string(file_path.encode("utf-8")))
+        kind, body = self._response(request_id)
+        if kind == MSG_CAN_FORMAT_RESPONSE:
+            return struct.unpack_from(">I", body, 4)[0] == 1
+        raise EditorServiceError(f"unexpected message kind {kind}")
 
-        def save_after_format():
-            if self.view.is_dirty():
-                self.view.run_command("save")
-            sublime.status_message("Formatted and saved with dprint")
+    def _format(self, file_path, code):
+        body = b"".join((
+            _pack_string(file_path.encode("utf-8")),
+            struct.pack(">II", 0, len(code)),
+            _pack_string(b"{}"),
+            _pack_string(code),
+        ))
+        request_id = self._send(MSG_FORMAT_FILE, body)
+        kind, body = self._response(request_id)
+        if kind == MSG_FORMAT_FILE_RESPONSE:
+            if struct.unpack_from(">I", body, 4)[0] == 0:
+                return None
+            length = struct.unpack_from(">I", body, 8)[0]
+            return body[12:12 + length]
+        raise EditorServiceError(f"unexpected message kind {kind}")
 
-        # Wait a tiny bit for Sublime to mark buffer dirty before saving
-        sublime.set_timeout(save_after_format, 50)
+    def _response(self, request_id):
+        """Read messages until the response to request_id arrives."""
+        while True:
+            message_id, kind, body = self._recv()
+            if kind == MSG_ACTIVE:
+                self._send(MSG_SUCCESS_RESPONSE, struct.pack(">I", message_id))
+                continue
+            if len(body) < 4 or struct.unpack_from(">I", body)[0] != request_id:
+                continue
+            if kind == MSG_ERROR_RESPONSE:
+                length = struct.unpack_from(">I", body, 4)[0]
+                raise DprintError(strip_ansi(body[8:8 + length]).decode("utf-8", "replace"))
+            return kind, body
 
+    def _spawn(self):
+        if self.closed:
+            raise EditorServiceError("editor service was shut down")
+        cmd = [
+            which("dprint"),
+            "editor-service",
+            "--config",
+            self.config_path,
+            "--parent-pid",
+            str(os.getpid()),
+        ]
+        if _DEBUG:
+            print("[dprint] Starting:", " ".join(cmd))
+        self.proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(self.config_path),
+            **PIPE_OPTIONS,
+        )
 
-class DprintReplaceContentCommand(sublime_plugin.TextCommand):
-    def run(self, edit, text):
-        old = self.view.substr(sublime.Region(0, self.view.size()))
-        if old == text:
-            # Nothing changed — skip to avoid gutter flicker
+    def shutdown(self):
+        """Ask the process to exit without blocking the caller.
+
+        Called on the UI thread, so a busy or hung service is killed rather
+        than waited for, and the exit is reaped on a helper thread.
+        """
+        self.closed = True
+        if not self.lock.acquire(timeout=0):
+            # Mid-request; the request fails and falls back to dprint fmt
+            proc = self.proc
+            if proc is not None:
+                try:
+                    proc.kill()
+                except OSError:
+                    pass
             return
+        try:
+            proc = self.proc
+            if proc is None or proc.poll() is not None:
+                self.proc = None
+                return
+            try:
+                self._send(MSG_SHUTDOWN_PROCESS)
+                proc.stdin.close()
+            except OSError:
+                pass
+            self.proc = None
+        finally:
+            self.lock.release()
+        threading.Thread(target=_reap, args=(proc,), daemon=True).start()
 
-        # Compute minimal diff region
-        prefix_len = 0
-        while prefix_len < len(old) and prefix_len < len(text) and old[prefix_len] == text[prefix_len]:
-            prefix_len += 1
+    def _kill(self):
+        if self.proc is not None:
+            try:
+                self.proc.kill()
+                self.proc.wait()
+            except OSError:
+                pass
+            self.proc = None
 
-        suffix_len = 0
-        while suffix_len < len(old) - prefix_len and suffix_len < len(text) - prefix_len and \
-                old[-(suffix_len + 1)] == text[-(suffix_len + 1)]:
-            suffix_len += 1
+    def _send(self, kind, body=b""):
+        self.next_id += 1
+        header = struct.pack(">III", self.next_id, kind, len(body))
+        self.proc.stdin.write(header + body + _SUCCESS_BYTES)
+        self.proc.stdin.flush()
+        return self.next_id
 
-            # Avoid overlapping
-            if suffix_len + prefix_len > len(old) or suffix_len + prefix_len > len(text):
-                suffix_len = 0
-                break
+    def _recv(self):
+        message_id, kind, length = struct.unpack(">III", self._read(12))
+        body = self._read(length)
+        if self._read(4) != _SUCCESS_BYTES:
+            raise EditorServiceError("malformed message from editor service")
+        return message_id, kind, body
+
+    def _read(self, size):
+        data = self.proc.stdout.read(size)
+        if len(data) != size:
+            raise EditorServiceError("editor service exited")
+        return data
+
+
+# After this many failed saves in a row a config stays on dprint fmt until
+# the plugin reloads, instead of paying for respawns on every save
+MAX_SERVICE_FAILURES = 3
+
+_daemons = {}
+_daemons_lock = threading.Lock()
+_editor_service_supported = None
+
+
+def _probe_editor_service():
+    """Check that the installed dprint speaks our editor-service schema."""
+    try:
+        result = subprocess.run(
+            [which("dprint"), "editor-info"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        info = json.loads(result.stdout.decode("utf-8"))
+        return info.get("schemaVersion") == EDITOR_SCHEMA_VERSION
+    except (OSError, ValueError, AttributeError):
+        return False
+
+
+# config path -> (config mtime, {file path: bool})
+_covered = {}
 
-        start = prefix_len
-        end_old = len(old) - suffix_len
-        end_new = len(text) - suffix_len
 
-        region = sublime.Region(start, end_old)
-        new_content = text[start:end_new]
-        self.view.replace(edit, region, new_content)
+def dprint_covers(daemon, file_path):
+    """Whether the daemon's config formats file_path.
+
+    Verdicts are cached per file, since includes and excludes match on file
+    names, and a config's verdicts are dropped together when it changes.
+    """
+    try:
+        config_mtime = os.stat(daemon.config_path).st_mtime_ns
+    except OSError:
+        config_mtime = None
+    cached = _covered.get(daemon.config_path)
+    if cached is None or cached[0] != config_mtime:
+        cached = _covered[daemon.config_path] = (config_mtime, {})
+    verdicts = cached[1]
+    covered = verdicts.get(file_path)
+    if covered is None:
+        covered = verdicts[file_path] = daemon.can_format(file_path)
+    return covered
+
+
+def shutdown_daemons():
+    """Stop every editor service started by this plugin instance."""
+    global _editor_service_supported
+    with _daemons_lock:
+        daemons = list(_daemons.values())
+        _daemons.clear()
+        _editor_service_supported = None
+    for daemon in daemons:
+        daemon.shutdown()
+
+
+def get_daemon(config_path):
+    """Return the shared editor-service client for config_path, if supported."""
+    global _editor_service_supported
+    with _daemons_lock:
+        if _editor_service_supported is None:
+            _editor_service_supported = _probe_editor_service()
+            if not _editor_service_supported:
+                print("[dprint] Editor service unavailable, using dprint fmt.")
+        if not _editor_service_supported:
+            return None
+        daemon = _daemons.get(config_path)
+        if daemon is None:
+            daemon = _daemons[config_path] = _DaemonClient(config_path)
+        if daemon.failures >= MAX_SERVICE_FAILURES:
+            return None
+        return daemon
+
+
+def warm_up():
+    """Start editor services for the open projects' configs.
+
+    Runs once at plugin load so the first save does not pay for launching
+    dprint from a cold disk cache. On dprint versions without a matching
+    editor service, the schema probe alone still primes the binary.
+    """
+    if which("dprint") is None:
+        print("[dprint] dprint not found on PATH; format on save is disabled.")
+        return
+    refresh_project_configs()
+    for config_path in set(_project_cfg.values()):
+        daemon = get_daemon(config_path)
+        if daemon is None:
+            return
+        try:
+            daemon.start()
+        except (OSError, EditorServiceError) as e:
+            print("[dprint] Could not start editor service:", e)
+            return
+
+
+def plugin_loaded():
+    settings = sublime.load_settings(SETTINGS_FILE)
+    settings.add_on_change("dprint_on_save", _load_settings)
+    _load_settings()
+    sublime.set_timeout_async(warm_up)
+
+
+def plugin_unloaded():
+    sublime.load_settings(SETTINGS_FILE).clear_on_change("dprint_on_save")
+    # --parent-pid only covers Sublime exiting; a plugin reload would
+    # otherwise orphan the running editor services
+    _lookup_executor.shutdown(wait=False)
+    _executor.shutdown(wait=False)
+    shutdown_daemons()
+    with _cfg_lock:
+        _cfg_cache.clear()
+        _project_cfg.clear()
+        _window_folders.clear()
+
+
+# view id -> hash() of the buffer as the last successful format left it
+_last_hash = {}
+# view id -> change count of a save issued by the plugin itself
+_suppress = {}
+
+
+def _run_format(jobs, config_path):
+    """Format a batch of saved views that share one dprint config."""
+    for view, file_path, change_count, original_code in jobs:
+        try:
+            _format_view(view, file_path, config_path, change_count, original_code)
+        finally:
+            _finish(view.id())
+
+
+def _format_view(view, file_path, config_path, change_count, original_code):
+    try:
+        if _DEBUG:
+            print(f"[dprint] Formatting started for: {file_path}")
+
+        # Encode once; both the editor service and the CLI take bytes
+        code = original_code.encode("utf-8")
+        formatted = _format_code(file_path, config_path, code)
+        if formatted:
+            formatted = formatted.decode("utf-8")
+        if formatted and "\r" in formatted:
+            # Buffers always use \n; Sublime applies the file's own
+            # line endings when saving
+            formatted = formatted.replace("\r\n", "\n")
+        if formatted and formatted != original_code:
+            _last_hash[view.id()] = hash(formatted)
+            # Diff here on the worker; the UI thread only applies the edits
+            edits = _diff_edits(original_code, formatted)
+            sublime.set_timeout(lambda: _apply_edit(view, edits, change_count), 0)
+            if _DEBUG:
+                print("[dprint] File formatted successfully.")
+        else:
+            _last_hash[view.id()] = hash(original_code)
+            if _DEBUG:
+                print("[dprint] No formatting changes needed.")
+    except DprintError as e:
+        print("[dprint] Error:")
+        print(e)
+    except Exception as e:
+        print("[dprint] Exception:", e)
+
+
+def _format_code(file_path, config_path, code):
+    """Format UTF-8 code through the editor service, falling back to `dprint fmt`."""
+    daemon = get_daemon(config_path)
+    if daemon is not None:
+        try:
+            if not dprint_covers(daemon, file_path):
+                if _DEBUG:
+                    print(f"[dprint] Skipped (not matched by config): {file_path}")
+                return None
+            formatted = daemon.format(file_path, code)
+            daemon.failures = 0
+            return formatted
+        except (OSError, EditorServiceError) as e:
+            print("[dprint] Editor service failed, using dprint fmt:", e)
+            daemon.failures += 1
+            if daemon.failures >= MAX_SERVICE_FAILURES:
+                print(f"[dprint] Editor service keeps failing for {config_path}; "
+                      "using dprint fmt until the plugin reloads.")
+                daemon.shutdown()
+
+    cmd = [
+        which("dprint"),
+        "fmt",
+        f"--stdin={file_path}",
+        "--config",
+        config_path,
+    ]
+    if _DEBUG:
+        print("[dprint] Running:", " ".join(cmd))
+
+    # Absolute argv[0] and no cwd/env/preexec_fn keep CPython on its
+    # cheapest spawn path; close_fds stays on so descriptors plugin_host
+    # inherited from Sublime do not leak into dprint.
+    # stderr stays a separate pipe so diagnostics never mix into the
+    # formatted text; communicate() already drives both pipes with
+    # selectors on POSIX, and Windows pipes cannot be polled.
+    result = subprocess.run(
+        cmd,
+        input=code,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=REQUEST_TIMEOUT,
+        **PIPE_OPTIONS,
+    )
+    if result.returncode != 0:
+        raise DprintError(strip_ansi(result.stderr).decode("utf-8", "replace"))
+    return result.stdout
+
+
+def _apply_edit(view, edits, change_count):
+    """Replace file content and auto-save silently."""
+    if view.change_count() != change_count:
+        # Buffer was edited while dprint ran; the result is stale
+        if _DEBUG:
+            print("[dprint] Buffer changed during formatting — skipping.")
+        return
+    # change_count is unchanged, so the view still holds the text the
+    # edits were computed against
+    view.run_command("dprint_replace_content", {"edits": edits})
+
+    # The edit is committed (and the view marked dirty) by the time
+    # run_command returns, so the save can follow immediately
+    if view.is_dirty():
+        # Keyed by change count so a save that never reaches on_post_save
+        # cannot swallow a later save by the user
+        _suppress[view.id()] = view.change_count()
+        view.run_command("save")
+    sublime.status_message("Formatted and saved with dprint")
+
+
+DEBOUNCE_MS = 80
+
+# Formatting is IO-bound (waiting on dprint), so a small shared pool is
+# enough and avoids starting a thread per save.
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="dprint")
+# Config lookups get their own thread so they never queue behind a slow
+# format, and so one view's saves are resolved in the order they arrived
+_lookup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dprint-config")
+
+# config path -> {view id: job}, and when the latest of those saves arrived
+_pending = {}
+_last_queued = {}
+# view id -> job for views saved again while already being formatted
+_in_flight = {}
+# view id -> newest change count queued, so a snapshot that reaches
+# queue_format late never replaces a newer one
+_latest_queued = {}
+_pending_lock = threading.Lock()
+
+
+def _resolve_config(view, file_path, change_count, original_code):
+    config_path = find_dprint_config(os.path.dirname(file_path))
+    if not config_path:
+        if _DEBUG:
+            print("[dprint] No config found — skipping.")
+        return
+    queue_format(view, file_path, config_path, change_count, original_code)
+
+
+def queue_format(view, file_path, config_path, change_count, original_code):
+    """Queue a saved view, debouncing bursts of saves per config.
+
+    A config's batch runs once no save has touched it for DEBOUNCE_MS, so
+    "Save All" is handled by one worker and a view saved repeatedly is
+    formatted once, with its latest contents. A view saved while it is
+    being formatted is queued again once, after the running format finishes.
+    """
+    with _pending_lock:
+        if change_count < _latest_queued.get(view.id(), -1):
+            # A newer save of this view is already queued
+            return
+        _latest_queued[view.id()] = change_count
+        if view.id() in _in_flight:
+            _in_flight[view.id()] = (view, file_path, config_path, change_count, original_code)
+            return
+        _last_queued[config_path] = time.monotonic()
+        batch = _pending.get(config_path)
+        if batch is None:
+            batch = _pending[config_path] = {}
+            sublime.set_timeout_async(lambda: _flush_pending(config_path), DEBOUNCE_MS)
+        batch[view.id()] = (view, file_path, change_count, original_code)
+
+
+def _flush_pending(config_path):
+    with _pending_lock:
+        idle_ms = (time.monotonic() - _last_queued.get(config_path, 0)) * 1000
+        if idle_ms < DEBOUNCE_MS:
+            # More saves arrived since the timer was set; wait for a quiet gap
+            delay = int(DEBOUNCE_MS - idle_ms) + 1
+            sublime.set_timeout_async(lambda: _flush_pending(config_path), delay)
+            return
+        _last_queued.pop(config_path, None)
+        batch = _pending.pop(config_path, None)
+        if batch:
+            for view_id in batch:
+                _in_flight[view_id] = None
+    if batch:
+        _executor.submit(_run_format, list(batch.values()), config_path)
+
+
+def _finish(view_id):
+    with _pending_lock:
+        rerun = _in_flight.pop(view_id, None)
+    if rerun:
+        queue_format(*rerun)
+
+
+def _common_prefix_len(a, b):
+    """Length of the common prefix of two strings.
+
+    Binary search over slice comparisons: about log2(n) interpreter steps,
+    with the character-by-character work done in C.
+    """
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix_len(a, b, limit):
+    """Length of the common suffix of two strings, capped at limit."""
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid:len(a) - lo] == b[len(b) - mid:len(b) - lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+# Beyond this many line edits the Myers trace gets large; fall back to
+# replacing the whole changed span in one go
+MAX_DIFF_EDITS = 300
+
+
+def _line_hunks(old_lines, new_lines):
+    """Myers O(ND) diff of two line lists.
+
+    Returns (i1, i2, j1, j2) hunks meaning old_lines[i1:i2] is replaced by
+    new_lines[j1:j2], or None when more than MAX_DIFF_EDITS edits are needed.
+    """
+    n, m = len(old_lines), len(new_lines)
+    v = {1: 0}
+    trace = []
+    for d in range(min(n + m, MAX_DIFF_EDITS) + 1):
+        trace.append(v.copy())
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and old_lines[x] == new_lines[y]:
+                x += 1
+                y += 1
+            v[k] = x
+            if x >= n and y >= m:
+                return _hunks_from_trace(trace, n, m)
+    return None
+
+
+def _hunks_from_trace(trace, n, m):
+    # Walk the trace backwards collecting matched line pairs, then turn
+    # the gaps between matches into hunks
+    matches = []
+    x, y = n, m
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[k - 1] < v[k + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = v[prev_k]
+        prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            x -= 1
+            y -= 1
+            matches.append((x, y))
+        x, y = prev_x, prev_y
+    matches.reverse()
+
+    hunks = []
+    i = j = 0
+    for match_i, match_j in matches + [(n, m)]:
+        if match_i > i or match_j > j:
+            hunks.append((i, match_i, j, match_j))
+        i, j = match_i + 1, match_j + 1
+    return hunks
+
+
+def _diff_edits(old, text):
+    """Replacements that turn old into text.
+
+    Edits come back bottom-up as [begin, end, new], so applying them in
+    order keeps the earlier offsets valid.
+    """
+    prefix_len = _common_prefix_len(old, text)
+    if prefix_len == len(old) == len(text):
+        # Nothing changed — skip to avoid gutter flicker
+        return []
+    suffix_len = _common_suffix_len(old, text, min(len(old), len(text)) - prefix_len)
+
+    start = prefix_len
+    end_old = len(old) - suffix_len
+    end_new = len(text) - suffix_len
+
+    # Diff the remaining span by lines so separate changes become
+    # separate small replaces, keeping untouched lines (and their
+    # gutter marks) out of the edit
+    old_lines = old[start:end_old].splitlines(True)
+    new_lines = text[start:end_new].splitlines(True)
+    hunks = None
+    if len(old_lines) > 1 and len(new_lines) > 1:
+        hunks = _line_hunks(old_lines, new_lines)
+    if hunks is None:
+        return [[start, end_old, text[start:end_new]]]
+
+    offsets = [start]
+    for line in old_lines:
+        offsets.append(offsets[-1] + len(line))
+    return [
+        [offsets[i1], offsets[i2], "".join(new_lines[j1:j2])]
+        for i1, i2, j1, j2 in reversed(hunks)
+    ]
+
+
+class DprintReplaceContentCommand(sublime_plugin.TextCommand):
+    def run(self, edit, edits):
+        for begin, end, new in edits:
+            self.view.replace(edit, sublime.Region(begin, end), new)
+
+
+SUPPORTED_EXTS = frozenset((".js", ".jsx", ".ts", ".tsx", ".json", ".css", ".html", ".md"))
 
 
 class DprintOnSave(sublime_plugin.EventListener):
     def on_post_save(self, view):
+        if _suppress.pop(view.id(), None) == view.change_count():
+            return
+
         file_path = view.file_name()
         if not file_path:
-            print("[dprint] No file path.")
+            if _DEBUG:
+                print("[dprint] No file path.")
             return
 
-        if not file_path.endswith((".js", ".jsx", ".ts", ".tsx", ".json", ".css", ".html", ".md")):
-            print(f"[dprint] Skipped (unsupported file): {file_path}")
+        if os.path.basename(file_path) in CONFIG_NAMES:
+            # A config was edited; cached lookups and results may now be wrong
+            _last_hash.clear()
+            sublime.set_timeout_async(refresh_project_configs)
+
+        if os.path.splitext(file_path)[1].lower() not in SUPPORTED_EXTS:
+            if _DEBUG:
+                print(f"[dprint] Skipped (unsupported file): {file_path}")
             return
 
-        folder = os.path.dirname(file_path)
-        config_path = find_dprint_config(folder)
-        if not config_path:
-            print("[dprint] No config found — skipping.")
+        # Resolved once and memoized until PATH changes; without the binary
+        # there is nothing to hand the buffer to
+        if which("dprint") is None:
             return
 
-        DprintFormatThread(view, file_path, config_path).start()
+        # Snapshot the buffer here, on the main thread, so the text and its
+        # change count are taken together and workers never read the view
+        change_count = view.change_count()
+        original_code = view.substr(sublime.Region(0, view.size()))
+        if _last_hash.get(view.id()) == hash(original_code):
+            if _DEBUG:
+                print("[dprint] Skipped (already formatted).")
+            return
+
+        # The config lookup touches the disk, so it runs on a worker
+        _lookup_executor.submit(_resolve_config, view, file_path, change_count, original_code)
+
+    def on_close(self, view):
+        _last_hash.pop(view.id(), None)
+        _suppress.pop(view.id(), None)
+        with _pending_lock:
+            _latest_queued.pop(view.id(), None)
+
+    def on_load_project_async(self, window):
+        refresh_project_configs()
+
+    def on_new_window_async(self, window):
+        refresh_project_configs()
+
+    def on_activated_async(self, view):
+        # Catches folders added through the folder picker or by drag and
+        # drop, which no window command reports once the folder is known
+        window = view.window()
+        if window is not None and tuple(window.folders()) != _window_folders.get(window.id()):
+            refresh_project_configs()
+
+    def on_post_window_command(self, window, command_name, args):
+        if command_name in ("remove_folder", "refresh_folder_list"):
+            sublime.set_timeout_async(refresh_project_configs)